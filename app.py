@@ -5,6 +5,7 @@ from flask import Flask
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 
+from transport.json_provider import OrjsonProvider
 from transport.models import db
 from transport.routes.admin import admin_bp
 
@@ -12,7 +13,7 @@ from transport.routes.admin import admin_bp
 csrf = CSRFProtect()
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
 
     # Basic config
@@ -21,6 +22,13 @@ def create_app():
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SECRET_KEY"] = "change-me-in-production"
 
+    # Overrides (e.g. tests) must land before the extensions read the config
+    if config:
+        app.config.update(config)
+
+    # Faster JSON encoding for jsonify() / |tojson
+    app.json = OrjsonProvider(app)
+
     # Initialise CSRF protection
     csrf.init_app(app)
 
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+from app import create_app
+from transport.models import (
+    db,
+    Agreement,
+    Booking,
+    Company,
+    LorryDetails,
+    Route,
+)
+
+
+@pytest.fixture
+def app():
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite://",
+            "WTF_CSRF_ENABLED": False,
+        }
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def booking(app):
+    """One active booking with no material list yet."""
+    company = Company(name="Acme Transport", address="1 Depot Road")
+    db.session.add(company)
+    db.session.flush()
+
+    agreement = Agreement(
+        loa_number="LOA-1",
+        total_mt_km=100000.0,
+        rate_per_mt_km=1.5,
+        is_active=True,
+        company_id=company.id,
+    )
+    lorry = LorryDetails(capacity=10, carrier_size="20 ft", number_of_wheels=6)
+    route = Route(code="R_AAA_BBB_TEST", name="AAA – BBB", total_km=120)
+    db.session.add_all([agreement, lorry, route])
+    db.session.flush()
+
+    booking = Booking(
+        agreement_id=agreement.id,
+        company_id=company.id,
+        lorry_id=lorry.id,
+        route_id=route.id,
+        trip_km=120,
+        placement_date=date(2024, 1, 10),
+        booking_date=date(2024, 1, 9),
+    )
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def flashed(client):
+    """Flash messages (category, message) queued in the client's session."""
+    with client.session_transaction() as sess:
+        return sess.get("_flashes", [])
@@ -0,0 +1,102 @@
+from conftest import flashed
+from transport.models import db, BookingMaterial
+
+INVALID_NUMBER = (
+    "Invalid number in materials section. "
+    "Please check quantity, rate and amount fields."
+)
+
+
+def _edit_materials(client, booking, **form):
+    return client.post(f"/admin/booking/{booking.id}/materials-edit", data=form)
+
+
+def _material(booking):
+    db.session.expire_all()
+    return db.session.query(BookingMaterial).filter_by(booking_id=booking.id).first()
+
+
+def test_edit_accepts_exponent_line_quantity(client, booking):
+    resp = _edit_materials(
+        client,
+        booking,
+        material_mode="ITEM",
+        **{
+            "line_description[]": "Cement",
+            "line_quantity[]": "1e1",
+            "line_rate[]": "2",
+            "line_amount[]": "",
+        },
+    )
+    assert resp.status_code == 302
+
+    material = _material(booking)
+    (line,) = material.lines
+    assert (line.quantity, line.rate, line.amount) == (10.0, 2.0, 20.0)
+    assert material.total_amount == 20.0
+    assert flashed(client) == [("success", "Material list saved.")]
+
+
+def test_edit_accepts_exponent_header_amount(client, booking):
+    _edit_materials(
+        client,
+        booking,
+        material_mode="LUMPSUM",
+        material_total_amount="1e2",
+    )
+
+    assert _material(booking).total_amount == 100.0
+    assert flashed(client) == [("success", "Material list saved.")]
+
+
+def test_edit_rejects_garbage_number(client, booking):
+    resp = _edit_materials(
+        client,
+        booking,
+        material_mode="ITEM",
+        **{
+            "line_description[]": "Cement",
+            "line_quantity[]": "ten",
+            "line_rate[]": "2",
+            "line_amount[]": "",
+        },
+    )
+    assert resp.status_code == 302
+
+    assert _material(booking) is None
+    assert flashed(client) == [("error", INVALID_NUMBER)]
+
+
+def test_edit_rejects_garbage_header_amount(client, booking):
+    _edit_materials(
+        client,
+        booking,
+        material_mode="LUMPSUM",
+        material_total_amount="12,5",
+    )
+
+    assert _material(booking) is None
+    assert flashed(client) == [("error", INVALID_NUMBER)]
+
+
+def test_parse_row_error_skips_content_check(app):
+    from flask import get_flashed_messages
+
+    from transport.routes.admin.bookings import _parse_materials_from_request
+
+    form = {
+        "material_mode": "ITEM",
+        "material_line_description[]": "",
+        "material_line_unit[]": "",
+        "material_line_quantity[]": "5",
+        "material_line_rate[]": "",
+        "material_line_amount[]": "",
+    }
+    with app.test_request_context("/", method="POST", data=form):
+        assert _parse_materials_from_request() is None
+        assert get_flashed_messages(with_categories=True) == [
+            (
+                "error",
+                "Each material row must have a description if any other field is filled.",
+            )
+        ]
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import namedtuple
+
+from transport.models import db, Agreement, Location, LorryDetails
+
+
+class TTLCache:
+    """
+    Tiny in-process cache whose entries expire after `ttl` seconds.
+
+    Intended for rarely-changing lookups on hot request paths. Callers that
+    mutate the underlying data should call clear() so the next read is fresh.
+    Only plain values should be stored: ORM instances outlive their session.
+    """
+
+    def __init__(self, ttl: float, maxsize: int | None = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        # Serializes eviction + insert under threaded servers
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            if (
+                self.maxsize is not None
+                and key not in self._data
+                and len(self._data) >= self.maxsize
+            ):
+                # Evict the oldest entry (dicts keep insertion order)
+                self._data.pop(next(iter(self._data)), None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Snapshot of the active agreement's identifiers (safe to keep across sessions)
+ActiveAgreement = namedtuple("ActiveAgreement", "id company_id")
+
+active_agreement_cache = TTLCache(ttl=30)
+
+# Location code -> authorities map used by the booking forms
+booking_auth_map_cache = TTLCache(ttl=60)
+
+# (code, code) endpoint pair -> route KM options for the KM assistant
+route_km_cache = TTLCache(ttl=60, maxsize=1024)
+
+# Dropdown rows for the booking forms, as plain tuples
+LorryOption = namedtuple("LorryOption", "id capacity carrier_size number_of_wheels")
+LocationOption = namedtuple("LocationOption", "id code name")
+
+lorry_options_cache = TTLCache(ttl=60)
+location_options_cache = TTLCache(ttl=60)
+
+
+def get_active_agreement():
+    """
+    Return the active agreement as an ActiveAgreement snapshot, or None.
+
+    Cached for a short time; agreement routes clear the cache on change.
+    """
+    cached = active_agreement_cache.get("active")
+    if cached is not None:
+        return cached
+
+    agreement = Agreement.query.filter_by(is_active=True).first()
+    if not agreement:
+        return None
+
+    snapshot = ActiveAgreement(agreement.id, agreement.company_id)
+    active_agreement_cache.set("active", snapshot)
+    return snapshot
+
+
+def get_lorry_options():
+    """All lorry types (smallest capacity first) as LorryOption tuples; cached."""
+    cached = lorry_options_cache.get("all")
+    if cached is not None:
+        return cached
+
+    rows = db.session.query(
+        LorryDetails.id,
+        LorryDetails.capacity,
+        LorryDetails.carrier_size,
+        LorryDetails.number_of_wheels,
+    ).order_by(LorryDetails.capacity)
+    options = tuple(LorryOption(*r) for r in rows)
+    lorry_options_cache.set("all", options)
+    return options
+
+
+def get_location_options():
+    """All locations (by name) as LocationOption tuples; cached."""
+    cached = location_options_cache.get("all")
+    if cached is not None:
+        return cached
+
+    rows = db.session.query(Location.id, Location.code, Location.name).order_by(
+        Location.name
+    )
+    options = tuple(LocationOption(*r) for r in rows)
+    location_options_cache.set("all", options)
+    return options
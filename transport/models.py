@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime, date
 
 db = SQLAlchemy()
@@ -112,6 +113,11 @@ class Route(db.Model):
 
 class RouteStop(db.Model):
     __tablename__ = "route_stop"
+    __table_args__ = (
+        # Support "route has a start/end-cluster stop at X" lookups
+        db.Index("ix_route_stop_route_start", "route_id", "is_start_cluster"),
+        db.Index("ix_route_stop_route_end", "route_id", "is_end_cluster"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -237,6 +243,11 @@ class BookingAuthority(db.Model):
     booking = db.relationship("Booking", backref="booking_authorities")
     authority = db.relationship("Authority")
 
+    @validates("role")
+    def _normalize_role(self, key, value):
+        # Stored uppercase so readers can compare with a plain ==
+        return value.strip().upper() if value else value
+
     def __repr__(self):
         return f"<BookingAuthority booking={self.booking_id} authority={self.authority_id} role={self.role}>"
 
@@ -283,6 +294,10 @@ class BookingMaterial(db.Model):
 
 class BookingMaterialLine(db.Model):
     __tablename__ = "booking_material_line"
+    __table_args__ = (
+        # Lines are always read, ordered and replaced per material header
+        db.Index("ix_bml_material_seq", "booking_material_id", "sequence_index"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
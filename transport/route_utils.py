@@ -1,5 +1,11 @@
 import hashlib
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
+
+
+def normalize_location_codes(codes: Iterable[str]) -> List[str]:
+    """Strip and uppercase location codes, dropping blanks."""
+    # Strip each code once; the outer filter drops the now-empty ones
+    return [c for c in (x.strip().upper() for x in codes if x) if c]
 
 
 def build_route_code_and_name(
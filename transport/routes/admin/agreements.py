@@ -1,5 +1,6 @@
 from flask import request, redirect, url_for, flash
 from transport.models import db, Agreement, Company
+from transport.cache_utils import active_agreement_cache
 from . import admin_bp
 from sqlalchemy import func
 
@@ -130,6 +131,7 @@ def edit_agreement(agreement_id: int):
         return _redirect_agreement_tab()
 
     db.session.commit()
+    active_agreement_cache.clear()
     flash("Agreement updated successfully.", "success")
     return _redirect_agreement_tab()
 
@@ -145,6 +147,7 @@ def activate_agreement(agreement_id: int):
     # Activate this one
     ag.is_active = True
     db.session.commit()
+    active_agreement_cache.clear()
 
     flash("Agreement activated.", "success")
     return _redirect_agreement_tab()
@@ -1,5 +1,6 @@
 from flask import request, redirect, url_for, jsonify, flash
 from transport.models import db, Authority, Location
+from transport.cache_utils import booking_auth_map_cache
 from . import admin_bp
 
 
@@ -47,6 +48,7 @@ def add_authority():
     )
     db.session.add(auth)
     db.session.commit()
+    booking_auth_map_cache.clear()
 
     flash("Authority added successfully.", "success")
     return _redirect_authority_tab()
@@ -78,6 +80,7 @@ def edit_authority():
     auth.address = address or None
 
     db.session.commit()
+    booking_auth_map_cache.clear()
     flash("Authority updated successfully.", "success")
     return _redirect_authority_tab()
 
@@ -121,6 +124,7 @@ def quick_add_authority():
     )
     db.session.add(auth)
     db.session.commit()
+    booking_auth_map_cache.clear()
 
     return jsonify(
         {
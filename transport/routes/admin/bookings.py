@@ -1,5 +1,17 @@
-from flask import request, redirect, url_for, flash, jsonify, render_template
+import math
+import re
+
+from flask import abort, request, redirect, url_for, flash, jsonify, render_template
+from collections import Counter, namedtuple
 from datetime import date, datetime
+from functools import lru_cache
+from itertools import groupby, zip_longest
+from operator import attrgetter, itemgetter
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, selectinload
 
 from transport.models import (
     db,
@@ -8,98 +20,248 @@ from transport.models import (
     Route,
     Location,
     RouteStop,
-    Agreement,
     LorryDetails,
     BookingAuthority,
     BookingMaterial,
     BookingMaterialLine,
 )
 
-from transport.route_utils import build_route_code_and_name
+from transport.cache_utils import (
+    booking_auth_map_cache,
+    get_active_agreement,
+    get_location_options,
+    get_lorry_options,
+    route_km_cache,
+)
+from transport.route_utils import build_route_code_and_name, normalize_location_codes
 from . import admin_bp
 
 
+@lru_cache(maxsize=8)
+def _dashboard_url(script_root: str) -> str:
+    """
+    Build the dashboard URL once per script root.
+
+    url_for() needs a request context, so the cache is keyed on the
+    mount point to stay correct if the app is served under a prefix.
+    """
+    return url_for("admin.dashboard")
+
+
 def _redirect_to_tab(tab_hash: str):
     """Redirect back to a specific dashboard tab (e.g., '#booking')."""
-    return redirect(url_for("admin.dashboard") + tab_hash)
+    return redirect(_dashboard_url(request.script_root) + tab_hash)
+
+
+def _fail(tab_hash: str, *msgs: str):
+    """Flash validation error(s) as a single message and redirect to a tab."""
+    flash(msgs[0] if len(msgs) == 1 else " ".join(msgs), "error")
+    return _redirect_to_tab(tab_hash)
+
+
+def _get_lorry(lorry_id: int):
+    """
+    Fetch a lorry type by id.
+
+    Session.get() checks the identity map first, so repeated lookups of the
+    same lorry within one request do not hit the database again.
+    """
+    return db.session.get(LorryDetails, lorry_id)
+
+
+def _form_value(key: str, upper: bool = False) -> str:
+    """Stripped form field value ("" when missing), optionally uppercased."""
+    value = (request.form.get(key) or "").strip()
+    return value.upper() if upper else value
+
+
+# Dialect-specific INSERT constructs that support ON CONFLICT DO NOTHING
+_ON_CONFLICT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _insert_route_if_new(code: str, name: str, total_km: int):
+    """
+    Insert a Route unless one with `code` already exists.
+
+    Returns the new route's id, or None when the code was already taken.
+    PostgreSQL and SQLite do this in one ON CONFLICT DO NOTHING statement;
+    any other backend falls back to a lookup followed by a plain INSERT.
+    """
+    values = {"code": code, "name": name, "total_km": total_km}
+    dialect_insert = _ON_CONFLICT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert is not None:
+        return db.session.execute(
+            dialect_insert(Route)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=["code"])
+            .returning(Route.id)
+        ).scalar()
+
+    if db.session.scalar(select(Route.id).where(Route.code == code)) is not None:
+        return None
+    return db.session.execute(
+        insert(Route).values(**values).returning(Route.id)
+    ).scalar_one()
+
+
+def _to_ints(values):
+    """Coerce form values to ints, silently dropping anything unparsable."""
+    # Ids are positive, so a digit check replaces try/except around int();
+    # isdecimal() (unlike isdigit()) rejects "²" and friends that int() refuses
+    return [int(v) for v in values if v and v.isdecimal()]
+
+
+# Finite decimal numbers as accepted by the forms' number inputs ("12",
+# "-3.5", ".75", "1e2"); float() would also take "nan"/"inf", which are
+# rejected here. Shared by _maybe_float and _to_float.
+_NUM_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def _maybe_float(raw: str, err: list):
+    """
+    Parse an already-stripped form value as float.
+
+    Blank → None. On a bad number sets err[0] = True and returns None.
+    Validated with _NUM_RE first, so bad input never raises inside float().
+    """
+    if not raw:
+        return None
+    if _NUM_RE.fullmatch(raw):
+        return float(raw)
+    err[0] = True
+    return None
+
+
+# YYYY-MM-DD as posted by <input type="date">
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _parse_iso_date(raw: str):
+    """Parse a YYYY-MM-DD form value; malformed or impossible dates → None."""
+    if not _ISO_DATE_RE.fullmatch(raw):
+        return None
+    try:
+        # Still raises for well-formed but impossible dates (e.g. 2024-02-30)
+        return date.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+def _to_float(raw, err: list):
+    """
+    Parse a raw edit-form value (str or None) as float.
+
+    Blank → None. A non-blank bad number sets err[0] = True, as _maybe_float.
+    """
+    # Form values are always str or None; missing/empty fields skip the strip
+    if not raw:
+        return None
+    return _maybe_float(raw.strip(), err)
+
+
+# BookingMaterialLine columns that make up a line's content
+_LINE_COLUMNS = ("sequence_index", "description", "unit", "quantity", "rate", "amount")
+_line_values = attrgetter(*_LINE_COLUMNS)
+
+# BookingMaterial header totals exposed by the materials JSON
+_HEADER_COLUMNS = ("total_quantity", "total_quantity_unit", "total_amount")
+_header_values = attrgetter(*_HEADER_COLUMNS)
+
+
+# Parsed material list from the booking forms (plain tuples; dicts are only
+# built at INSERT time)
+MaterialLine = namedtuple("MaterialLine", "description unit quantity rate amount")
+MaterialPayload = namedtuple(
+    "MaterialPayload", "mode total_quantity total_quantity_unit total_amount lines"
+)
+
+
+# Per-line material inputs on the booking forms, in row-tuple order
+_MATERIAL_LINE_FIELDS = (
+    "material_line_description[]",
+    "material_line_unit[]",
+    "material_line_quantity[]",
+    "material_line_rate[]",
+    "material_line_amount[]",
+)
+
+
+def _check_item_materials(*, has_lines, **_):
+    """ITEM mode: at least one line is required."""
+    if not has_lines:
+        return "In ITEM mode, enter at least one material line."
+    return None
+
 
+def _check_lumpsum_materials(*, has_header_values, has_lines, has_header_qty, has_line_qty):
+    """LUMPSUM mode: header values or lines, and never both kinds of quantity."""
+    if not has_header_values and not has_lines:
+        return "In LUMPSUM mode, enter a header quantity/amount or at least one material line."
+    # Hard Rule A: header total qty and per-line qty must not both be used
+    if has_header_qty and has_line_qty:
+        return "In LUMPSUM mode, use either the header total quantity or per-line quantities, not both."
+    return None
 
-def _normalize_codes(codes):
-    """Strip and uppercase location codes, dropping blanks."""
-    return [c.strip().upper() for c in codes if c and c.strip()]
+
+# Material mode -> content check; returns an error message or None.
+# Shared by the booking forms and the materials edit form.
+_MATERIAL_CONTENT_CHECKS = {
+    "ITEM": _check_item_materials,
+    "LUMPSUM": _check_lumpsum_materials,
+}
+_MATERIAL_MODES = frozenset(_MATERIAL_CONTENT_CHECKS)
 
 
 def _parse_materials_from_request():
     """
     Parse and validate materials from request.form.
 
-    Returns a dict:
-      {
-        "mode": "ITEM" or "LUMPSUM",
-        "total_quantity": float|None,
-        "total_quantity_unit": str|None,
-        "total_amount": float|None,
-        "lines": [
-          {"description": str, "unit": str|None,
-           "quantity": float|None, "rate": float|None,
-           "amount": float|None},
-          ...
-        ]
-      }
+    Returns a MaterialPayload:
+      mode                 "ITEM" or "LUMPSUM"
+      total_quantity       float|None
+      total_quantity_unit  str|None
+      total_amount         float|None (ITEM: sum of line amounts)
+      lines                list of MaterialLine(description, unit,
+                           quantity, rate, amount)
 
     On validation error: flashes messages and returns None.
     """
-    material_payload = None
-    material_number_error = False
+    number_error = [False]
 
-    material_mode_raw = (request.form.get("material_mode") or "").strip().upper()
+    material_mode_raw = _form_value("material_mode", upper=True)
 
-    header_qty_str = (request.form.get("material_total_quantity") or "").strip()
-    header_qty_unit = (request.form.get("material_total_quantity_unit") or "").strip()
-    header_amount_str = (request.form.get("material_total_amount") or "").strip()
-
-    header_qty = None
-    header_amount = None
+    header_qty_str = _form_value("material_total_quantity")
+    header_qty_unit = _form_value("material_total_quantity_unit")
+    header_amount_str = _form_value("material_total_amount")
 
     # Parse header numbers (lenient: if blank → None)
-    if header_qty_str:
-        try:
-            header_qty = float(header_qty_str)
-        except ValueError:
-            material_number_error = True
-
-    if header_amount_str:
-        try:
-            header_amount = float(header_amount_str)
-        except ValueError:
-            material_number_error = True
-
-    # Per-line fields
-    line_descs = request.form.getlist("material_line_description[]")
-    line_units = request.form.getlist("material_line_unit[]")
-    line_qty_strs = request.form.getlist("material_line_quantity[]")
-    line_rate_strs = request.form.getlist("material_line_rate[]")
-    line_amount_strs = request.form.getlist("material_line_amount[]")
+    header_qty = _maybe_float(header_qty_str, number_error)
+    header_amount = _maybe_float(header_amount_str, number_error)
 
-    lines_data = []
-    max_len = (
-        max(
-            len(line_descs),
-            len(line_units),
-            len(line_qty_strs),
-            len(line_rate_strs),
-            len(line_amount_strs),
-        )
-        if (line_descs or line_units or line_qty_strs or line_rate_strs or line_amount_strs)
-        else 0
-    )
+    # Per-line fields; skip the getlist calls entirely when no line was posted
+    form = request.form
+    if any(field in form for field in _MATERIAL_LINE_FIELDS):
+        line_lists = [form.getlist(field) for field in _MATERIAL_LINE_FIELDS]
+    else:
+        line_lists = []
 
-    for idx in range(max_len):
-        desc = line_descs[idx] if idx < len(line_descs) else ""
-        unit = line_units[idx].strip() if idx < len(line_units) else ""
-        qty_str = line_qty_strs[idx].strip() if idx < len(line_qty_strs) else ""
-        rate_str = line_rate_strs[idx].strip() if idx < len(line_rate_strs) else ""
-        amount_str = line_amount_strs[idx].strip() if idx < len(line_amount_strs) else ""
+    lines_data = []
+    missing_desc = False
+    has_line_qty = False
+    line_amounts = []  # collected in the row loop; ITEM total = fsum of these
+
+    # Local aliases for the per-row loop (fast local lookups)
+    strip = str.strip
+    parse = _maybe_float
+    add_line = lines_data.append
+
+    for desc, unit, qty_str, rate_str, amount_str in zip_longest(
+        *line_lists, fillvalue=""
+    ):
+        unit = strip(unit)
+        qty_str = strip(qty_str)
+        rate_str = strip(rate_str)
+        amount_str = strip(amount_str)
 
         # Entirely empty row → skip
         if not (desc or unit or qty_str or rate_str or amount_str):
@@ -107,50 +269,29 @@ def _parse_materials_from_request():
 
         # Description is mandatory for any non-empty row
         if not desc:
-            flash(
-                "Each material row must have a description if any other field is filled.",
-                "error",
-            )
-            return None
+            missing_desc = True
+            continue
 
-        qty = None
-        rate = None
-        amount = None
-
-        if qty_str:
-            try:
-                qty = float(qty_str)
-            except ValueError:
-                material_number_error = True
-
-        if rate_str:
-            try:
-                rate = float(rate_str)
-            except ValueError:
-                material_number_error = True
-
-        if amount_str:
-            try:
-                amount = float(amount_str)
-            except ValueError:
-                material_number_error = True
-
-        lines_data.append(
-            {
-                "description": desc,
-                "unit": unit or None,
-                "quantity": qty,
-                "rate": rate,
-                "amount": amount,
-            }
-        )
+        qty = parse(qty_str, number_error)
+        rate = parse(rate_str, number_error)
+        amount = parse(amount_str, number_error)
+        if qty is not None:
+            has_line_qty = True
+        if amount is not None:
+            line_amounts.append(amount)
 
-    if material_number_error:
-        flash(
-            "Invalid number in materials section. Please check quantity, rate and amount fields.",
-            "error",
+        add_line(MaterialLine(desc, unit or None, qty, rate, amount))
+
+    # Collect every problem and flash them together
+    errors: list[str] = []
+    if missing_desc:
+        errors.append(
+            "Each material row must have a description if any other field is filled."
+        )
+    if number_error[0]:
+        errors.append(
+            "Invalid number in materials section. Please check quantity, rate and amount fields."
         )
-        return None
 
     has_header_values = bool(
         header_qty is not None or header_amount is not None or header_qty_unit
@@ -158,73 +299,46 @@ def _parse_materials_from_request():
     has_lines = bool(lines_data)
 
     # From now on, *every* booking must include some materials.
-    # 1) Mode must be chosen
     if not material_mode_raw:
-        flash(
+        # 1) Mode must be chosen
+        errors.append(
             "Each booking must include a material list. "
-            "Choose ITEM or LUMPSUM and enter at least one material.",
-            "error",
+            "Choose ITEM or LUMPSUM and enter at least one material."
         )
-        return None
+    elif material_mode_raw not in _MATERIAL_MODES:
+        # 2) Mode must be valid
+        errors.append("Material mode must be either ITEM or LUMPSUM.")
+    elif not errors:
+        # 3) Per-mode minimum content / consistency. Skipped after row errors:
+        #    rejected rows are missing from lines_data, so the checks would
+        #    report content the user did enter as absent.
+        problem = _MATERIAL_CONTENT_CHECKS[material_mode_raw](
+            has_header_values=has_header_values,
+            has_lines=has_lines,
+            has_header_qty=header_qty is not None,
+            has_line_qty=has_line_qty,
+        )
+        if problem:
+            errors.append(problem)
 
-    # 2) Mode must be valid
-    if material_mode_raw not in ("ITEM", "LUMPSUM"):
-        flash("Material mode must be either ITEM or LUMPSUM.", "error")
+    if errors:
+        flash(" ".join(errors), "error")
         return None
 
-    # 3) Per-mode minimum content
+    # Build payload according to mode (validation above guarantees content)
     if material_mode_raw == "ITEM":
-        # ITEM mode requires at least one line
-        if not has_lines:
-            flash(
-                "In ITEM mode, enter at least one material line.",
-                "error",
-            )
-            return None
-    elif material_mode_raw == "LUMPSUM":
-        # LUMPSUM mode requires either header qty/amount OR at least one line
-        if not has_header_values and not has_lines:
-            flash(
-                "In LUMPSUM mode, enter a header quantity/amount or at least one material line.",
-                "error",
-            )
-            return None
-
-    # LUMPSUM-specific validation: header total quantity vs per-line quantities
-    if material_mode_raw == "LUMPSUM" and (has_header_values or has_lines):
-        has_header_qty = header_qty is not None
-        has_line_qty = any(line["quantity"] is not None for line in lines_data)
-        if has_header_qty and has_line_qty:
-            flash(
-                "In LUMPSUM mode, use either the header total quantity or per-line quantities, not both.",
-                "error",
-            )
-            return None
-
-    # Build payload according to mode
-    if material_mode_raw and (has_header_values or has_lines):
-        if material_mode_raw == "ITEM":
-            # ITEM mode: header quantity/unit ignored, total_amount from line amounts
-            total_amt = sum(
-                (line["amount"] or 0.0)
-                for line in lines_data
-                if line["amount"] is not None
-            )
-            header_qty = None
-            header_qty_unit = ""
-            header_amount = total_amt if lines_data else None
-
-        material_payload = {
-            "mode": material_mode_raw,
-            "total_quantity": header_qty,
-            "total_quantity_unit": header_qty_unit or None,
-            "total_amount": header_amount,
-            "lines": lines_data,
-        }
-    else:
-        material_payload = None
-
-    return material_payload
+        # ITEM mode: header quantity/unit ignored, total_amount from line amounts
+        header_qty = None
+        header_qty_unit = ""
+        header_amount = math.fsum(line_amounts)
+
+    return MaterialPayload(
+        material_mode_raw,
+        header_qty,
+        header_qty_unit or None,
+        header_amount,
+        lines_data,
+    )
 
 
 def _create_booking_core(
@@ -234,23 +348,26 @@ def _create_booking_core(
     placement_date: date,
     booking_date: date,
     lorry_id: int,
-    material_payload: dict | None,
+    material_payload: MaterialPayload | None,
     remarks_prefix: str | None = None,
 ):
     """
     Shared core logic for creating a Booking (normal or backdated).
 
     On error: flashes messages and returns None.
-    On success: commits and returns the Booking instance.
+    On success: commits and returns the new Booking id.
+
+    Every row is written with a Core INSERT (ids come back via RETURNING),
+    so nothing is flushed until the single commit at the end.
     """
     # Lorry must exist
-    lorry = LorryDetails.query.get(lorry_id)
+    lorry = _get_lorry(lorry_id)
     if not lorry:
         flash("Selected lorry does not exist.", "error")
         return None
 
     # There must be an active agreement; that defines the company as well
-    active_agreement = Agreement.query.filter_by(is_active=True).first()
+    active_agreement = get_active_agreement()
     if not active_agreement:
         flash(
             "No active agreement found. Please activate an agreement before creating a booking.",
@@ -267,12 +384,7 @@ def _create_booking_core(
         return None
 
     # Enforce that each location appears only once in this booking's route
-    seen = set()
-    duplicates = []
-    for c in seq_codes:
-        if c in seen and c not in duplicates:
-            duplicates.append(c)
-        seen.add(c)
+    duplicates = [c for c, n in Counter(seq_codes).items() if n > 1]
     if duplicates:
         dup_str = ", ".join(duplicates)
         flash(
@@ -281,51 +393,42 @@ def _create_booking_core(
         )
         return None
 
-    # Look up Location objects in order and ensure all exist
-    locations = []
-    missing_codes = []
-    code_to_location = {}
-
-    for code in seq_codes:
-        if code in code_to_location:
-            loc = code_to_location[code]
-        else:
-            loc = Location.query.filter_by(code=code).first()
-            if not loc:
-                missing_codes.append(code)
-                continue
-            code_to_location[code] = loc
-        locations.append(loc)
+    # Look up all Location objects in one query and ensure all exist.
+    # Duplicates were rejected above, so seq_codes is already unique.
+    code_to_location = {
+        loc.code: loc
+        for loc in Location.query.filter(Location.code.in_(seq_codes)).all()
+    }
 
+    missing_codes = [c for c in seq_codes if c not in code_to_location]
     if missing_codes:
-        human = ", ".join(sorted(set(missing_codes)))
+        human = ", ".join(sorted(missing_codes))
         flash(f"Unknown location code(s): {human}.", "error")
         return None
 
-    # Validate authorities: at least one per FROM and DEST location
-    missing_loading = []
-    for code in from_codes:
-        auth_ids = request.form.getlist(f"loading_{code}[]")
-        if not auth_ids:
-            missing_loading.append(code)
+    locations = [code_to_location[c] for c in seq_codes]
 
-    missing_unloading = []
-    for code in dest_codes:
-        auth_ids = request.form.getlist(f"unloading_{code}[]")
-        if not auth_ids:
-            missing_unloading.append(code)
+    # Selected authority ids per location, read and coerced from the form once
+    loading = {c: _to_ints(request.form.getlist(f"loading_{c}[]")) for c in from_codes}
+    unloading = {c: _to_ints(request.form.getlist(f"unloading_{c}[]")) for c in dest_codes}
+
+    # Validate authorities: at least one per FROM and DEST location.
+    # Codes are unique here (duplicates were rejected above), so the
+    # missing lists need no further dedup.
+    missing_loading = [c for c in from_codes if not loading[c]]
+    missing_unloading = [c for c in dest_codes if not unloading[c]]
 
     if missing_loading or missing_unloading:
         msgs = []
         if missing_loading:
             msgs.append(
                 "Select at least one loading authority for each FROM location "
-                f"(missing for: {', '.join(sorted(set(missing_loading)))})."
+                f"(missing for: {', '.join(sorted(missing_loading))})."
             )
         if missing_unloading:
             msgs.append(
                 "Select at least one unloading authority for each DESTINATION location "
-                f"(missing for: {', '.join(sorted(set(missing_unloading)))})."
+                f"(missing for: {', '.join(sorted(missing_unloading))})."
             )
         flash(" ".join(msgs), "error")
         return None
@@ -343,9 +446,13 @@ def _create_booking_core(
         trip_km,
     )
 
-    # Either fetch existing route or create a new one
-    route = Route.query.filter_by(code=route_code).first()
-    if route:
+    # Create the route if this pattern is new; the id comes back only when a
+    # row was actually inserted.
+    route_id = _insert_route_if_new(route_code, route_name, trip_km)
+
+    route_created = route_id is not None
+    if not route_created:
+        route = Route.query.filter_by(code=route_code).first()
         # If an existing route with this pattern has a different distance, reject
         if route.total_km != trip_km:
             flash(
@@ -354,119 +461,109 @@ def _create_booking_core(
                 "error",
             )
             return None
+        route_id = route.id
     else:
-        # Create the Route
-        route = Route(
-            code=route_code,
-            name=route_name,
-            total_km=trip_km,
-        )
-        db.session.add(route)
-        db.session.flush()  # get route.id
-
-        # Create RouteStops for this new route
-        for idx, loc in enumerate(locations, start=1):
-            stop = RouteStop(
-                route_id=route.id,
-                location_id=loc.id,
-                sequence_index=idx,
-                is_start_cluster=(idx == 1),
-                is_end_cluster=(idx == len(locations)),
-            )
-            db.session.add(stop)
+        # Create RouteStops for this new route (one multi-row INSERT)
+        n = len(locations)
+        stop_dicts = [
+            {
+                "route_id": route_id,
+                "location_id": loc.id,
+                "sequence_index": idx,
+                "is_start_cluster": idx == 1,
+                "is_end_cluster": idx == n,
+            }
+            for idx, loc in enumerate(locations, start=1)
+        ]
+        db.session.execute(RouteStop.__table__.insert(), stop_dicts)
 
     # -------------------------------
     # Create the Booking header
     # -------------------------------
     remarks_value = remarks_prefix if remarks_prefix else None
 
-    booking = Booking(
-        agreement_id=active_agreement.id,
-        company_id=active_agreement.company_id,
-        lorry_id=lorry.id,
-        route_id=route.id,
-        trip_km=trip_km,
-        placement_date=placement_date,
-        booking_date=booking_date,
-        remarks=remarks_value,
-    )
-    db.session.add(booking)
-    db.session.flush()  # get booking.id
+    booking_id = db.session.execute(
+        insert(Booking)
+        .values(
+            agreement_id=active_agreement.id,
+            company_id=active_agreement.company_id,
+            lorry_id=lorry.id,
+            route_id=route_id,
+            trip_km=trip_km,
+            placement_date=placement_date,
+            booking_date=booking_date,
+            remarks=remarks_value,
+        )
+        .returning(Booking.id)
+    ).scalar_one()
 
     # -------------------------------
-    # Create BookingAuthority entries
+    # Create BookingAuthority entries (one multi-row INSERT)
     # -------------------------------
+    ba_rows = []
+
     loading_seq = 1
     for code in from_codes:
-        auth_ids = request.form.getlist(f"loading_{code}[]")
-        for aid in auth_ids:
-            try:
-                aid_int = int(aid)
-            except (TypeError, ValueError):
-                continue
-            ba = BookingAuthority(
-                booking_id=booking.id,
-                authority_id=aid_int,
-                role="LOADING",
-                sequence_index=loading_seq,
+        for aid in loading[code]:
+            ba_rows.append(
+                {
+                    "booking_id": booking_id,
+                    "authority_id": aid,
+                    "role": "LOADING",
+                    "sequence_index": loading_seq,
+                }
             )
-            db.session.add(ba)
             loading_seq += 1
 
     unloading_seq = 1
     for code in dest_codes:
-        auth_ids = request.form.getlist(f"unloading_{code}[]")
-        for aid in auth_ids:
-            try:
-                aid_int = int(aid)
-            except (TypeError, ValueError):
-                continue
-            ba = BookingAuthority(
-                booking_id=booking.id,
-                authority_id=aid_int,
-                role="UNLOADING",
-                sequence_index=unloading_seq,
+        for aid in unloading[code]:
+            ba_rows.append(
+                {
+                    "booking_id": booking_id,
+                    "authority_id": aid,
+                    "role": "UNLOADING",
+                    "sequence_index": unloading_seq,
+                }
             )
-            db.session.add(ba)
             unloading_seq += 1
 
+    if ba_rows:
+        db.session.execute(BookingAuthority.__table__.insert(), ba_rows)
+
     # -------------------------------
-    # MATERIALS: create ORM entities
+    # MATERIALS: header + lines
     # -------------------------------
-    if material_payload:
-        material = BookingMaterial(
-            booking_id=booking.id,
-            mode=material_payload["mode"],
-            total_quantity=material_payload["total_quantity"],
-            total_quantity_unit=material_payload["total_quantity_unit"],
-            total_amount=material_payload["total_amount"],
-        )
-
-        # Attach lines
-        for idx, line_data in enumerate(material_payload["lines"], start=1):
-            line = BookingMaterialLine(
-                booking_material_id=material.id if material.id is not None else None,
-                sequence_index=idx,
-                description=line_data["description"],
-                unit=line_data["unit"],
-                quantity=line_data["quantity"],
-                rate=line_data["rate"],
-                amount=line_data["amount"],
-            )
-            material.lines.append(line)
-
-        # For ITEM mode, derive header total_amount from line amounts
-        if material.mode == "ITEM":
-            total_amt = sum(
-                (l.amount or 0.0) for l in material.lines if l.amount is not None
+    if material_payload is not None:
+        # ITEM totals were already derived from the lines by the parser
+        material_id = db.session.execute(
+            insert(BookingMaterial)
+            .values(
+                booking_id=booking_id,
+                mode=material_payload.mode,
+                total_quantity=material_payload.total_quantity,
+                total_quantity_unit=material_payload.total_quantity_unit,
+                total_amount=material_payload.total_amount,
             )
-            material.total_amount = total_amt if material.lines else None
+            .returning(BookingMaterial.id)
+        ).scalar_one()
 
-        booking.material_table = material
-        db.session.add(material)
+        # Attach lines with one multi-row INSERT
+        if material_payload.lines:
+            line_dicts = [
+                {
+                    "booking_material_id": material_id,
+                    "sequence_index": idx,
+                    **line._asdict(),
+                }
+                for idx, line in enumerate(material_payload.lines, start=1)
+            ]
+            db.session.execute(BookingMaterialLine.__table__.insert(), line_dicts)
 
     db.session.commit()
-    return booking
+    if route_created:
+        route_km_cache.clear()
+    return booking_id
 
 
 @admin_bp.route("/booking/add", methods=["POST"])
@@ -475,8 +572,8 @@ def add_booking():
     from_codes_raw = request.form.getlist("from_locations[]")
     dest_codes_raw = request.form.getlist("dest_locations[]")
 
-    from_codes = _normalize_codes(from_codes_raw)
-    dest_codes = _normalize_codes(dest_codes_raw)
+    from_codes = normalize_location_codes(from_codes_raw)
+    dest_codes = normalize_location_codes(dest_codes_raw)
 
     errors = []
 
@@ -487,19 +584,18 @@ def add_booking():
         errors.append("Add at least one DESTINATION location.")
 
     # Placement date: required and cannot be before booking date (today)
-    placement_raw = (request.form.get("placement_date") or "").strip()
+    placement_raw = _form_value("placement_date")
     placement_date = None
     today = date.today()
 
     if not placement_raw:
         errors.append("Placement date is required.")
     else:
-        try:
-            placement_date = datetime.strptime(placement_raw, "%Y-%m-%d").date()
-            if placement_date < today:
-                errors.append("Placement date cannot be earlier than the booking date.")
-        except ValueError:
+        placement_date = _parse_iso_date(placement_raw)
+        if placement_date is None:
             errors.append("Invalid placement date.")
+        elif placement_date < today:
+            errors.append("Placement date cannot be earlier than the booking date.")
 
     # Trip KM and lorry_id
     trip_km = request.form.get("trip_km", type=int)
@@ -511,8 +607,7 @@ def add_booking():
         errors.append("Select a lorry.")
 
     if errors:
-        flash(" ".join(errors), "error")
-        return _redirect_to_tab("#booking")
+        return _fail("#booking", *errors)
 
     # MATERIALS via shared helper
     material_payload = _parse_materials_from_request()
@@ -522,7 +617,7 @@ def add_booking():
     # booking_date for normal flow is "today"
     booking_date = today
 
-    booking = _create_booking_core(
+    booking_id = _create_booking_core(
         from_codes=from_codes,
         dest_codes=dest_codes,
         trip_km=trip_km,
@@ -533,13 +628,46 @@ def add_booking():
         remarks_prefix=None,
     )
 
-    if booking is None:
+    if booking_id is None:
         return _redirect_to_tab("#booking")
 
     flash("Booking saved successfully.", "success")
     return _redirect_to_tab("#booking")
 
 
+def _build_booking_auth_map():
+    """
+    Map location code -> authorities at that location, for the booking forms.
+
+    Rows arrive sorted by location code, then title, so each list is already
+    in display order. The result is cached briefly; authority routes clear
+    the cache on change. Treat the returned dict as read-only.
+    """
+    cached = booking_auth_map_cache.get("map")
+    if cached is not None:
+        return cached
+
+    # Only the columns the forms need; no ORM instances are built
+    rows = (
+        db.session.query(
+            Location.code, Authority.id, Authority.authority_title, Authority.address
+        )
+        .join(Authority.location)
+        .order_by(Location.code, func.lower(Authority.authority_title))
+    )
+
+    booking_auth_map = {
+        code: [
+            {"id": auth_id, "title": title, "address": address}
+            for _, auth_id, title, address in group
+        ]
+        for code, group in groupby(rows, key=itemgetter(0))
+    }
+
+    booking_auth_map_cache.set("map", booking_auth_map)
+    return booking_auth_map
+
+
 @admin_bp.route("/booking/backdated", methods=["GET"])
 def backdated_booking_view():
     """
@@ -547,32 +675,13 @@ def backdated_booking_view():
     Uses the same data structures as the main booking tab.
     """
     # Lorry list
-    lorries = LorryDetails.query.order_by(LorryDetails.capacity).all()
+    lorries = get_lorry_options()
 
     # All known locations (for datalist autocomplete)
-    all_locations = Location.query.order_by(Location.name).all()
+    all_locations = get_location_options()
 
-    # Build authority lookup map: { "CODE": [ {id, title, address}, ... ] }
-    from transport.models import Authority   # import only if not already imported
-
-    booking_auth_map = {}
-    authorities = Authority.query.all()
-
-    for auth in authorities:
-        code = auth.location.code
-        if code not in booking_auth_map:
-            booking_auth_map[code] = []
-        booking_auth_map[code].append(
-            {
-                "id": auth.id,
-                "title": auth.authority_title,
-                "address": auth.address,
-            }
-        )
-
-    # Sort inside each location for cleaner UI
-    for code in booking_auth_map:
-        booking_auth_map[code].sort(key=lambda x: x["title"].lower())
+    # Authority lookup map: { "CODE": [ {id, title, address}, ... ] }
+    booking_auth_map = _build_booking_auth_map()
 
     return render_template(
         "admin/backdated_booking.html",
@@ -599,8 +708,8 @@ def add_backdated_booking():
     from_codes_raw = request.form.getlist("from_locations[]")
     dest_codes_raw = request.form.getlist("dest_locations[]")
 
-    from_codes = _normalize_codes(from_codes_raw)
-    dest_codes = _normalize_codes(dest_codes_raw)
+    from_codes = normalize_location_codes(from_codes_raw)
+    dest_codes = normalize_location_codes(dest_codes_raw)
 
     errors = []
 
@@ -611,9 +720,9 @@ def add_backdated_booking():
 
     today = date.today()
 
-    booking_raw = (request.form.get("booking_date") or "").strip()
-    placement_raw = (request.form.get("placement_date") or "").strip()
-    reason = (request.form.get("backdated_reason") or "").strip()
+    booking_raw = _form_value("booking_date")
+    placement_raw = _form_value("placement_date")
+    reason = _form_value("backdated_reason")
 
     booking_date = None
     placement_date = None
@@ -621,17 +730,15 @@ def add_backdated_booking():
     if not booking_raw:
         errors.append("Booking date is required for backdated entries.")
     else:
-        try:
-            booking_date = datetime.strptime(booking_raw, "%Y-%m-%d").date()
-        except ValueError:
+        booking_date = _parse_iso_date(booking_raw)
+        if booking_date is None:
             errors.append("Invalid booking date.")
 
     if not placement_raw:
         errors.append("Placement date is required.")
     else:
-        try:
-            placement_date = datetime.strptime(placement_raw, "%Y-%m-%d").date()
-        except ValueError:
+        placement_date = _parse_iso_date(placement_raw)
+        if placement_date is None:
             errors.append("Invalid placement date.")
 
     if booking_date and booking_date > today:
@@ -653,8 +760,7 @@ def add_backdated_booking():
         errors.append("Select a lorry.")
 
     if errors:
-        flash(" ".join(errors), "error")
-        return _redirect_to_tab("#booking")
+        return _fail("#booking", *errors)
 
     # MATERIALS via shared helper
     material_payload = _parse_materials_from_request()
@@ -663,7 +769,7 @@ def add_backdated_booking():
 
     remarks_prefix = f"[BACKDATED] {reason}"
 
-    booking = _create_booking_core(
+    booking_id = _create_booking_core(
         from_codes=from_codes,
         dest_codes=dest_codes,
         trip_km=trip_km,
@@ -674,7 +780,7 @@ def add_backdated_booking():
         remarks_prefix=remarks_prefix,
     )
 
-    if booking is None:
+    if booking_id is None:
         return _redirect_to_tab("#booking")
 
     flash("Backdated booking recorded successfully.", "success")
@@ -683,9 +789,15 @@ def add_backdated_booking():
 
 @admin_bp.route("/booking/<int:booking_id>/materials-json", methods=["GET"])
 def booking_materials_json(booking_id: int):
-    booking = Booking.query.get_or_404(booking_id)
+    booking = db.one_or_404(
+        select(Booking)
+        .options(
+            joinedload(Booking.material_table).selectinload(BookingMaterial.lines)
+        )
+        .where(Booking.id == booking_id)
+    )
 
-    material = getattr(booking, "material_table", None)
+    material = booking.material_table
     if material is None:
         return jsonify(
             {
@@ -697,24 +809,10 @@ def booking_materials_json(booking_id: int):
             }
         )
 
-    lines_payload = []
-    for line in material.lines:
-        lines_payload.append(
-            {
-                "sequence_index": line.sequence_index,
-                "description": line.description,
-                "unit": line.unit,
-                "quantity": line.quantity,
-                "rate": line.rate,
-                "amount": line.amount,
-            }
-        )
-
-    header_payload = {
-        "total_quantity": material.total_quantity,
-        "total_quantity_unit": material.total_quantity_unit,
-        "total_amount": material.total_amount,
-    }
+    lines_payload = [
+        dict(zip(_LINE_COLUMNS, _line_values(line))) for line in material.lines
+    ]
+    header_payload = dict(zip(_HEADER_COLUMNS, _header_values(material)))
 
     return jsonify(
         {
@@ -729,13 +827,11 @@ def booking_materials_json(booking_id: int):
 
 @admin_bp.route("/booking/<int:booking_id>/cancel", methods=["POST"])
 def cancel_booking(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
-
     # Read redirect tab + optional history filters
     redirect_tab = request.form.get("redirect_tab") or "#booking"
-    booking_scope = (request.form.get("booking_scope") or "").strip()
-    booking_status = (request.form.get("booking_status") or "").strip()
-    booking_search = (request.form.get("booking_search") or "").strip()
+    booking_scope = _form_value("booking_scope")
+    booking_status = _form_value("booking_status")
+    booking_search = _form_value("booking_search")
 
     def _redirect_after_cancel():
         # When cancelling from History tab, preserve filters
@@ -751,18 +847,30 @@ def cancel_booking(booking_id):
         # Fallback: original behaviour
         return _redirect_to_tab(redirect_tab)
 
-    if booking.status == "CANCELLED":
-        flash("Booking already cancelled.", "info")
-        return _redirect_after_cancel()
+    reason = _form_value("cancel_reason") or None
 
-    reason = (request.form.get("cancel_reason") or "").strip() or None
+    # Cancel with one conditional UPDATE; no need to load the booking first
+    updated = (
+        Booking.query.filter(Booking.id == booking_id, Booking.status != "CANCELLED")
+        .update(
+            {
+                "status": "CANCELLED",
+                "cancelled_at": datetime.utcnow(),
+                "cancel_reason": reason,
+            },
+            synchronize_session=False,
+        )
+    )
 
-    booking.status = "CANCELLED"
-    booking.cancelled_at = datetime.utcnow()
-    booking.cancel_reason = reason
+    if not updated:
+        # Nothing changed: either no such booking or it was already cancelled
+        if db.session.query(Booking.id).filter_by(id=booking_id).scalar() is None:
+            abort(404)
+        flash("Booking already cancelled.", "info")
+        return _redirect_after_cancel()
 
     db.session.commit()
-    flash(f"Booking {booking.id} cancelled.", "success")
+    flash(f"Booking {booking_id} cancelled.", "success")
 
     return _redirect_after_cancel()
 
@@ -770,7 +878,18 @@ def cancel_booking(booking_id):
 @admin_bp.route("/booking/<int:booking_id>", methods=["GET", "POST"])
 def booking_detail(booking_id):
     """View / edit a booking (safe fields only: placement_date, lorry)."""
-    booking = Booking.query.get_or_404(booking_id)
+    # Preload what the detail template walks (authorities with their
+    # locations, material lines) so rendering issues no per-row SELECTs.
+    booking = db.one_or_404(
+        select(Booking)
+        .options(
+            selectinload(Booking.booking_authorities)
+            .joinedload(BookingAuthority.authority)
+            .joinedload(Authority.location),
+            joinedload(Booking.material_table).selectinload(BookingMaterial.lines),
+        )
+        .where(Booking.id == booking_id)
+    )
 
     def _redirect_self_with_filters():
         """Redirect back to this detail view, preserving any history filters in the query string."""
@@ -790,26 +909,25 @@ def booking_detail(booking_id):
 
     # We'll let the user change placement_date + lorry_id only
     # Everything else is read-only for audit reasons.
-    lorries = LorryDetails.query.order_by(LorryDetails.capacity).all()
+    lorries = get_lorry_options()
 
     if request.method == "POST":
         errors: list[str] = []
 
         # Placement date: required, cannot be before booking_date
-        placement_raw = (request.form.get("placement_date") or "").strip()
+        placement_raw = _form_value("placement_date")
         placement_date = None
         if not placement_raw:
             errors.append("Placement date is required.")
         else:
-            try:
-                placement_date = datetime.strptime(placement_raw, "%Y-%m-%d").date()
-                # booking.booking_date is already set when created
-                if placement_date < booking.booking_date:
-                    errors.append(
-                        "Placement date cannot be earlier than the booking date."
-                    )
-            except ValueError:
+            placement_date = _parse_iso_date(placement_raw)
+            if placement_date is None:
                 errors.append("Invalid placement date.")
+            # booking.booking_date is already set when created
+            elif placement_date < booking.booking_date:
+                errors.append(
+                    "Placement date cannot be earlier than the booking date."
+                )
 
         # Lorry: must exist
         lorry_id = request.form.get("lorry_id", type=int)
@@ -817,13 +935,12 @@ def booking_detail(booking_id):
         if not lorry_id:
             errors.append("Select a lorry.")
         else:
-            lorry = LorryDetails.query.get(lorry_id)
+            lorry = _get_lorry(lorry_id)
             if not lorry:
                 errors.append("Selected lorry does not exist.")
 
         if errors:
-            for msg in errors:
-                flash(msg, "error")
+            flash(" ".join(errors), "error")
         else:
             booking.placement_date = placement_date
             booking.lorry_id = lorry.id
@@ -831,20 +948,19 @@ def booking_detail(booking_id):
             flash("Booking updated successfully.", "success")
             return _redirect_self_with_filters()
 
-    siblings = (
-        Booking.query.filter_by(agreement_id=booking.agreement_id)
-        .order_by(Booking.id.asc())
-        .all()
+    # Trip serial = 1-based position of this booking within its agreement,
+    # by immutable Booking.id (same numbering as the dashboard)
+    trip_serial = (
+        db.session.query(func.count(Booking.id))
+        .filter(
+            Booking.agreement_id == booking.agreement_id,
+            Booking.id <= booking.id,
+        )
+        .scalar()
     )
 
-    trip_serial = None
-    for idx, b in enumerate(siblings, start=1):
-        if b.id == booking.id:
-            trip_serial = idx
-            break
-
     # Materials (read-only)
-    material = getattr(booking, "material_table", None)
+    material = booking.material_table
 
     return render_template(
         "admin/booking_detail.html",
@@ -858,15 +974,16 @@ def booking_detail(booking_id):
 @admin_bp.route("/booking/<int:booking_id>/materials-edit", methods=["POST"])
 def booking_materials_edit(booking_id: int):
     """Create or update the material table for an existing booking."""
-    booking = Booking.query.get_or_404(booking_id)
+    booking = db.get_or_404(Booking, booking_id)
+    detail_url = url_for("admin.booking_detail", booking_id=booking.id)
 
     # Disallow edits on cancelled bookings
     if booking.status == "CANCELLED":
         flash("Cancelled bookings cannot be edited.", "error")
-        return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+        return redirect(detail_url)
 
     # Mode: "", ITEM, or LUMPSUM
-    mode = (request.form.get("material_mode") or "").strip().upper()
+    mode = _form_value("material_mode", upper=True)
 
     # From now on, a booking must always have a material list.
     # So an empty mode is not allowed here.
@@ -876,150 +993,158 @@ def booking_materials_edit(booking_id: int):
             "Choose ITEM or LUMPSUM and enter at least one material.",
             "error",
         )
-        return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+        return redirect(detail_url)
 
-    if mode not in ("ITEM", "LUMPSUM"):
+    if mode not in _MATERIAL_MODES:
         flash("Invalid material mode.", "error")
-        return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+        return redirect(detail_url)
 
     # Get or create BookingMaterial header (1:1 with Booking)
-    material = getattr(booking, "material_table", None)
+    material = booking.material_table
     if not material:
         material = BookingMaterial(booking_id=booking.id)
         db.session.add(material)
 
     material.mode = mode
 
-    def parse_float(form_name: str):
-        raw = request.form.get(form_name)
-        if raw is None:
-            return None
-        raw = raw.strip()
-        if not raw:
-            return None
-        try:
-            return float(raw)
-        except ValueError:
-            return None
+    # Bad numbers are reported, never silently stored as NULL
+    number_error = [False]
 
     # Header totals
     if mode == "LUMPSUM":
-        material.total_quantity = parse_float("material_total_quantity")
-        total_unit_raw = (request.form.get("material_total_quantity_unit") or "").strip()
+        material.total_quantity = _to_float(
+            request.form.get("material_total_quantity"), number_error
+        )
+        total_unit_raw = _form_value("material_total_quantity_unit")
         material.total_quantity_unit = total_unit_raw or None
     else:
         # In ITEM mode we do not persist a header quantity
         material.total_quantity = None
         material.total_quantity_unit = None
 
-    material.total_amount = parse_float("material_total_amount")
+    material.total_amount = _to_float(
+        request.form.get("material_total_amount"), number_error
+    )
 
     # --- Rebuild lines from form data ---
-    desc_list = request.form.getlist("line_description[]")
-    unit_list = request.form.getlist("line_unit[]")
-    qty_list = request.form.getlist("line_quantity[]")
-    rate_list = request.form.getlist("line_rate[]")
-    amt_list = request.form.getlist("line_amount[]")
-
-    # Clear existing lines; relationship should be configured with delete-orphan
-    material.lines.clear()
-
+    # New line rows; written with one bulk INSERT once validation passes
+    rows = []
     has_line_qty = False      # track per-line quantity usage (for LUMPSUM invariant)
-    has_any_line = False      # track if we have at least one logical line
-
-    def list_float(values, idx):
-        if idx >= len(values):
-            return None
-        raw = (values[idx] or "").strip()
-        if not raw:
-            return None
-        try:
-            return float(raw)
-        except ValueError:
-            return None
-
-    seq = 1
-    for i, desc in enumerate(desc_list):
-        desc = (desc or "").strip()
-        if not desc:
-            # Entirely empty / no description → skip row
-            continue
-
-        unit_val = (unit_list[i] if i < len(unit_list) else "") or ""
-        unit_val = unit_val.strip() or None
+    line_amounts = []         # collected in the row loop; ITEM total = fsum of these
+
+    desc_list = [(d or "").strip() for d in request.form.getlist("line_description[]")]
+
+    # Rows without a description are skipped, so with no descriptions
+    # there is nothing else to read.
+    if desc_list:
+        # Normalize every column once so the row loop sees clean values
+        unit_list = [(u or "").strip() or None for u in request.form.getlist("line_unit[]")]
+        rate_list = [_to_float(v, number_error) for v in request.form.getlist("line_rate[]")]
+        amt_list = [_to_float(v, number_error) for v in request.form.getlist("line_amount[]")]
+        qty_raw = request.form.getlist("line_quantity[]")
+
+        # With a LUMPSUM header quantity, line quantities only matter for the
+        # "not both" rule below, so presence is enough; no float parsing.
+        if mode == "LUMPSUM" and material.total_quantity is not None:
+            has_line_qty = any(d and (q or "").strip() for d, q in zip(desc_list, qty_raw))
+            qty_list = []
+        else:
+            qty_list = [_to_float(v, number_error) for v in qty_raw]
+
+        # Loop invariants, bound once
+        is_item = mode == "ITEM"
+        add_row = rows.append
+
+        seq = 1
+        for desc, unit_val, qty_val, rate_val, amt_val in zip_longest(
+            desc_list, unit_list, qty_list, rate_list, amt_list
+        ):
+            if not desc:
+                # Entirely empty / no description → skip row
+                continue
 
-        qty_val = list_float(qty_list, i)
-        rate_val = list_float(rate_list, i)
-        amt_val = list_float(amt_list, i)
+            if qty_val is not None:
+                has_line_qty = True
 
-        if qty_val is not None:
-            has_line_qty = True
-
-        if mode == "ITEM":
             # In ITEM mode, derive amount from qty * rate when both are present
-            if qty_val is not None and rate_val is not None:
+            if is_item and qty_val is not None and rate_val is not None:
                 amt_val = qty_val * rate_val
 
-        line = BookingMaterialLine(
-            booking_material_id=material.id if material.id else None,
-            sequence_index=seq,
-            description=desc,
-            unit=unit_val,
-            quantity=qty_val,
-            rate=rate_val,
-            amount=amt_val,
-        )
-        material.lines.append(line)
-        has_any_line = True
-        seq += 1
+            if amt_val is not None:
+                line_amounts.append(amt_val)
 
-    # Enforce invariants per mode
-    if mode == "ITEM":
-        # At least one line required
-        if not has_any_line:
-            flash(
-                "In ITEM mode, enter at least one material line.",
-                "error",
+            add_row(
+                {
+                    "sequence_index": seq,
+                    "description": desc,
+                    "unit": unit_val,
+                    "quantity": qty_val,
+                    "rate": rate_val,
+                    "amount": amt_val,
+                }
             )
-            db.session.rollback()
-            return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+            seq += 1
 
-        # Derive header total_amount from line amounts
-        total_amt = sum(
-            (ln.amount or 0.0) for ln in material.lines if ln.amount is not None
-        )
-        material.total_amount = total_amt if material.lines else None
+    has_any_line = bool(rows)  # at least one logical line
 
-    elif mode == "LUMPSUM":
-        has_header_values = bool(
-            material.total_quantity is not None
-            or material.total_amount is not None
-            or material.total_quantity_unit
+    if number_error[0]:
+        # Content checks would judge the form without the rejected values
+        problem = (
+            "Invalid number in materials section. "
+            "Please check quantity, rate and amount fields."
         )
-        has_lines = has_any_line
-
-        # Must have either header qty/amount OR at least one line
-        if not has_header_values and not has_lines:
-            flash(
-                "In LUMPSUM mode, enter a header quantity/amount or at least one material line.",
-                "error",
-            )
-            db.session.rollback()
-            return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+    else:
+        # Enforce invariants per mode
+        problem = _MATERIAL_CONTENT_CHECKS[mode](
+            has_header_values=bool(
+                material.total_quantity is not None
+                or material.total_amount is not None
+                or material.total_quantity_unit
+            ),
+            has_lines=has_any_line,
+            has_header_qty=material.total_quantity is not None,
+            has_line_qty=has_line_qty,
+        )
+    if problem:
+        flash(problem, "error")
+        db.session.rollback()
+        return redirect(detail_url)
 
-        # Hard Rule A: header total qty and per-line qty must not both be used
-        has_header_qty = material.total_quantity is not None
-        if has_header_qty and has_line_qty:
-            flash(
-                "In LUMPSUM mode, use either the header total quantity or per-line quantities, not both.",
-                "error",
+    if mode == "ITEM":
+        # Derive header total_amount from the amounts collected in the loop
+        material.total_amount = math.fsum(line_amounts)
+
+    # Only rewrite the lines when they actually changed; a save that just
+    # touches the header leaves the stored lines alone.
+    row_key = itemgetter(*_LINE_COLUMNS)
+    lines_changed = [row_key(r) for r in rows] != [_line_values(l) for l in material.lines]
+
+    if lines_changed:
+        # Replace lines: one DELETE + one multi-row INSERT (flush gives a new
+        # header its id first)
+        db.session.flush()
+        db.session.execute(
+            delete(BookingMaterialLine).where(
+                BookingMaterialLine.booking_material_id == material.id
             )
-            db.session.rollback()
-            return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+        )
+        # Line ids are not needed here and material.lines is not refreshed:
+        # the redirected detail view loads the new lines on the next request.
+        if rows:
+            for row in rows:
+                row["booking_material_id"] = material.id
+            db.session.execute(insert(BookingMaterialLine), rows)
 
     db.session.commit()
     flash("Material list saved.", "success")
-    return redirect(url_for("admin.booking_detail", booking_id=booking.id))
+    return redirect(detail_url)
+
+
+def _route_has_cluster_stop(cluster_flag, code: str):
+    """EXISTS clause: the route has a stop at `code` with `cluster_flag` set."""
+    return Route.stops.any(
+        and_(cluster_flag.is_(True), RouteStop.location.has(Location.code == code))
+    )
 
 
 @admin_bp.route("/route-km-json", methods=["GET"])
@@ -1037,44 +1162,33 @@ def route_km_json():
     if not from_code or not to_code:
         return jsonify({"options": []})
 
-    # Validate both locations exist
-    from_loc = Location.query.filter_by(code=from_code).first()
-    to_loc = Location.query.filter_by(code=to_code).first()
-
-    if not from_loc or not to_loc:
-        return jsonify({"options": []})
-
-    # Only active routes are considered
-    routes = Route.query.filter_by(is_active=True).all()
-
-    km_options = []
-
-    for r in routes:
-        # Collect start / end cluster codes from RouteStop flags
-        start_codes = [s.location.code for s in r.stops if s.is_start_cluster]
-        end_codes = [s.location.code for s in r.stops if s.is_end_cluster]
-
-        # Match in either direction: from→to or to→from
-        ok_1 = from_code in start_codes and to_code in end_codes
-        ok_2 = to_code in start_codes and from_code in end_codes
-
-        if ok_1 or ok_2:
-            km_options.append(
-                {
-                    "km": r.total_km,
-                    "route_code": r.code,
-                    "route_name": r.name,
-                }
-            )
-
-    # Deduplicate by (km, route_code) just in case
-    seen = set()
-    unique = []
-    for opt in km_options:
-        key = (opt["km"], opt["route_code"])
-        if key in seen:
-            continue
-        seen.add(key)
-        unique.append(opt)
+    # Matching is direction-agnostic, so both orders share one cache entry
+    cache_key = tuple(sorted((from_code, to_code)))
+    cached = route_km_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({"options": cached})
+
+    # Match in either direction: from→to or to→from. Filtering happens in
+    # SQL (correlated EXISTS per cluster) and only the needed columns return.
+    # Unknown codes simply match no stop, so this one query is the whole lookup.
+    forward = and_(
+        _route_has_cluster_stop(RouteStop.is_start_cluster, from_code),
+        _route_has_cluster_stop(RouteStop.is_end_cluster, to_code),
+    )
+    backward = and_(
+        _route_has_cluster_stop(RouteStop.is_start_cluster, to_code),
+        _route_has_cluster_stop(RouteStop.is_end_cluster, from_code),
+    )
+    rows = (
+        db.session.query(Route.total_km, Route.code, Route.name)
+        .filter(Route.is_active.is_(True), or_(forward, backward))
+        .order_by(Route.id)
+    )
 
-    return jsonify({"options": unique})
+    # Route.code is unique, so every row is already a distinct option
+    options = [
+        {"km": total_km, "route_code": code, "route_name": name}
+        for total_km, code, name in rows
+    ]
+    route_km_cache.set(cache_key, options)
+    return jsonify({"options": options})
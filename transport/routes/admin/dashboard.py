@@ -1,7 +1,10 @@
 from collections import defaultdict
+from operator import itemgetter
 
 from flask import render_template, request, redirect, url_for, flash
 
+from sqlalchemy.orm import joinedload, selectinload
+
 from . import admin_bp
 from transport.models import (
     db,
@@ -12,10 +15,16 @@ from transport.models import (
     Authority,
     Route,
     Booking,
+    BookingAuthority,
     AppConfig,
 )
 
 
+# Allowed values of the history tab filters
+_BOOKING_SCOPES = frozenset({"active", "all"})
+_BOOKING_STATUSES = frozenset({"all", "active", "cancelled"})
+
+
 def _allocate_trip_amount_and_bands(
     trip_mt_km: float,
     cum_mt_km_before: float,
@@ -89,6 +98,46 @@ def _allocate_trip_amount_and_bands(
     return amount, paid_mt_km, blocked_mt_km, cum
 
 
+def _booking_row_options():
+    """
+    Loader options for the booking history rows.
+
+    Each row walks booking_authorities -> authority -> location and
+    route -> stops; load those in a few batched SELECTs up front instead
+    of lazily per booking.
+    """
+    return (
+        selectinload(Booking.booking_authorities)
+        .joinedload(BookingAuthority.authority)
+        .joinedload(Authority.location),
+        selectinload(Booking.route).selectinload(Route.stops),
+    )
+
+
+def _codes_in_sequence(keyed_codes):
+    """Unique non-empty codes from (sequence_index, code) pairs, in sequence order."""
+    keyed_codes.sort(key=itemgetter(0))
+    return list(dict.fromkeys(code for _, code in keyed_codes if code))
+
+
+def _fmt_auths_short(entries):
+    """'Title @ CODE' list from (sequence, title, location) entries."""
+    out = [
+        f"{title} @ {loc.code}" if loc and loc.code else title
+        for _, title, loc in entries
+    ]
+    return ", ".join(out) if out else "-"
+
+
+def _fmt_auths_long(entries):
+    """'Title @ Name [CODE]' list from (sequence, title, location) entries."""
+    out = [
+        f"{title} @ {loc.name} [{loc.code}]" if loc else title
+        for _, title, loc in entries
+    ]
+    return ", ".join(out) if out else "-"
+
+
 def _compute_agreement_overview(agreement: Agreement):
     """
     Build overview summary + per-trip rows for the active agreement.
@@ -102,27 +151,35 @@ def _compute_agreement_overview(agreement: Agreement):
     total_mt_km = float(agreement.total_mt_km or 0.0)
     rate = float(agreement.rate_per_mt_km or 0.0)
 
-    # All bookings for this agreement, ordered by immutable Booking.id
+    # All bookings for this agreement, ordered by immutable Booking.id.
+    # Each trip row reads its lorry and authority locations, so prefetch
+    # them in batched SELECTs rather than lazily per booking.
     bookings_q = (
-        Booking.query.filter_by(agreement_id=agreement.id)
+        Booking.query.options(
+            joinedload(Booking.lorry),
+            selectinload(Booking.booking_authorities)
+            .joinedload(BookingAuthority.authority)
+            .joinedload(Authority.location),
+        )
+        .filter_by(agreement_id=agreement.id)
         .order_by(Booking.id.asc())
     )
     all_bookings = bookings_q.all()
 
     # Stable Trip ID per agreement = position in ID-ascending order
-    serial_by_id: dict[int, int] = {}
-    for idx, b_all in enumerate(all_bookings, start=1):
-        serial_by_id[b_all.id] = idx
+    serial_by_id: dict[int, int] = {
+        b_all.id: idx for idx, b_all in enumerate(all_bookings, start=1)
+    }
 
     # Ignore cancelled for utilisation & payments, but keep Trip ID from full set
     usable = [
         b for b in all_bookings
-        if getattr(b, "status", "ACTIVE") != "CANCELLED"
+        if b.status != "CANCELLED"
     ]
 
     def trip_mt_km_of(b: Booking) -> float:
         km = float(b.trip_km or 0)
-        cap = float(b.lorry.capacity) if getattr(b, "lorry", None) else 0.0
+        cap = float(b.lorry.capacity) if b.lorry else 0.0
         return km * cap
 
     utilised_mt_km = sum(trip_mt_km_of(b) for b in usable)
@@ -137,10 +194,9 @@ def _compute_agreement_overview(agreement: Agreement):
     blocked_total_mt_km = 0.0
     cum_mt_km_for_bands = 0.0
 
-    # For display, go in Booking.id order for usable trips
-    usable_sorted = sorted(usable, key=lambda b: b.id)
-
-    for b in usable_sorted:
+    # For display, go in Booking.id order for usable trips; all_bookings is
+    # already ordered by Booking.id in SQL, so `usable` needs no re-sort.
+    for b in usable:
         trip_serial = serial_by_id.get(b.id, 0)
         trip_mt_km = trip_mt_km_of(b)
 
@@ -156,37 +212,20 @@ def _compute_agreement_overview(agreement: Agreement):
         amount_booked_total += amount_for_trip
         blocked_total_mt_km += blocked_mt_km
 
-        # FROM / TO location codes (unique codes in sequence order)
-        loading_auths = [
-            ba for ba in getattr(b, "booking_authorities", [])
-            if ba.role == "LOADING"
-        ]
-        unloading_auths = [
-            ba for ba in getattr(b, "booking_authorities", [])
-            if ba.role == "UNLOADING"
-        ]
-        loading_auths.sort(key=lambda ba: ba.sequence_index or 0)
-        unloading_auths.sort(key=lambda ba: ba.sequence_index or 0)
-
-        from_codes_list = []
-        seen_from = set()
-        for ba in loading_auths:
-            auth = ba.authority
-            loc = auth.location if auth else None
-            code = loc.code if loc else None
-            if code and code not in seen_from:
-                from_codes_list.append(code)
-                seen_from.add(code)
-
-        to_codes_list = []
-        seen_to = set()
-        for ba in unloading_auths:
+        # FROM / TO location codes (unique codes in sequence order).
+        # One pass over the authorities resolves each sort key and location
+        # code once; the per-role lists are then just sorted and deduped.
+        keyed = {"LOADING": [], "UNLOADING": []}
+        for ba in b.booking_authorities:
+            bucket = keyed.get(ba.role)
+            if bucket is None:
+                continue
             auth = ba.authority
             loc = auth.location if auth else None
-            code = loc.code if loc else None
-            if code and code not in seen_to:
-                to_codes_list.append(code)
-                seen_to.add(code)
+            bucket.append((ba.sequence_index or 0, loc.code if loc else None))
+
+        from_codes_list = _codes_in_sequence(keyed["LOADING"])
+        to_codes_list = _codes_in_sequence(keyed["UNLOADING"])
 
         from_codes = ", ".join(from_codes_list) if from_codes_list else "-"
         to_codes = ", ".join(to_codes_list) if to_codes_list else "-"
@@ -200,7 +239,7 @@ def _compute_agreement_overview(agreement: Agreement):
                 "from_codes": from_codes,
                 "to_codes": to_codes,
                 "route_km": b.trip_km,
-                "lorry_capacity": getattr(b.lorry, "capacity", None),
+                "lorry_capacity": b.lorry.capacity if b.lorry else None,
                 "trip_mt_km": trip_mt_km,
                 "paid_mt_km": paid_mt_km,
                 "blocked_mt_km": blocked_mt_km,
@@ -291,65 +330,50 @@ def dashboard():
     # Booking scope filter (active vs all)
     # ---------------------------------
     booking_scope = request.args.get("booking_scope", "active")
-    if booking_scope not in ("active", "all"):
+    if booking_scope not in _BOOKING_SCOPES:
         booking_scope = "active"
 
     active_agreement = next(
-        (a for a in agreements if getattr(a, "is_active", False)), None
+        (a for a in agreements if a.is_active), None
     )
 
     # ---------------------------------
     # Build base sets for Trip ID and display
     # ---------------------------------
-    # 1) serial_source_bookings: used ONLY to compute Trip IDs,
-    #    and MUST include *all* bookings (including cancelled),
-    #    ordered by immutable Booking.id per agreement.
-    # 2) bookings: display set, later filtered by status/search.
+    # 1) bookings: display set (newest first), later filtered by
+    #    status/search.
+    # 2) serial_source_bookings: used ONLY to compute Trip IDs, and MUST
+    #    include *all* bookings (including cancelled), ordered by immutable
+    #    Booking.id per agreement. That is the unfiltered display set
+    #    reversed, so both come from one query.
+    bookings_q = Booking.query.options(*_booking_row_options())
     if booking_scope == "active" and active_agreement:
-        # All bookings for active agreement for Trip ID calculation
-        serial_source_bookings = (
-            Booking.query
-            .filter_by(agreement_id=active_agreement.id)
-            .order_by(Booking.id.asc())
-            .all()
-        )
-        # Display: same agreement, newest first
-        bookings = (
-            Booking.query
-            .filter_by(agreement_id=active_agreement.id)
-            .order_by(Booking.id.desc())
-            .all()
-        )
+        # Active agreement only
+        bookings_q = bookings_q.filter_by(agreement_id=active_agreement.id)
     else:
         # No active agreement or 'all' scope
         booking_scope = "all" if not active_agreement else booking_scope
 
-        # Trip IDs for all agreements, per agreement, by Booking.id
-        serial_source_bookings = (
-            Booking.query
-            .order_by(Booking.agreement_id.asc(), Booking.id.asc())
-            .all()
-        )
-        # Display: all bookings, newest first
-        bookings = Booking.query.order_by(Booking.id.desc()).all()
+    bookings = bookings_q.order_by(Booking.id.desc()).all()
+    serial_source_bookings = bookings[::-1]
 
     # ---------------------------------
     # Booking status filter (all / active / cancelled)
     # ---------------------------------
     booking_status = request.args.get("booking_status", "all")
-    if booking_status not in ("all", "active", "cancelled"):
+    if booking_status not in _BOOKING_STATUSES:
         booking_status = "all"
 
     if booking_status == "active":
         # Treat anything not explicitly CANCELLED as active
         bookings = [
             b for b in bookings
-            if getattr(b, "status", "ACTIVE") != "CANCELLED"
+            if b.status != "CANCELLED"
         ]
     elif booking_status == "cancelled":
         bookings = [
             b for b in bookings
-            if getattr(b, "status", "ACTIVE") == "CANCELLED"
+            if b.status == "CANCELLED"
         ]
 
     # ---------------------------------
@@ -373,20 +397,22 @@ def dashboard():
     booking_rows = []
 
     for b in bookings:
-        # All authorities in proper order
-        loading_auths = [
-            ba
-            for ba in getattr(b, "booking_authorities", [])
-            if ba.role == "LOADING"
-        ]
-        unloading_auths = [
-            ba
-            for ba in getattr(b, "booking_authorities", [])
-            if ba.role == "UNLOADING"
-        ]
+        # All authorities in proper order, each resolved to its
+        # (sequence, title, location) once for both display formats below
+        keyed = {"LOADING": [], "UNLOADING": []}
+        for ba in b.booking_authorities:
+            bucket = keyed.get(ba.role)
+            auth = ba.authority
+            if bucket is None or not auth:
+                continue
+            bucket.append(
+                (ba.sequence_index or 0, auth.authority_title or "", auth.location)
+            )
 
-        loading_auths.sort(key=lambda ba: ba.sequence_index or 0)
-        unloading_auths.sort(key=lambda ba: ba.sequence_index or 0)
+        loading_auths = keyed["LOADING"]
+        unloading_auths = keyed["UNLOADING"]
+        loading_auths.sort(key=itemgetter(0))
+        unloading_auths.sort(key=itemgetter(0))
 
         # --- INBOUND / OUTBOUND detection relative to home depot ---
         direction = None
@@ -405,43 +431,14 @@ def dashboard():
             elif home_in_start and home_in_end:
                 direction = "HOME"  # start & end at home cluster (loop)
 
-        def fmt_short(ba_list):
-            out = []
-            for ba in ba_list:
-                auth = ba.authority
-                if not auth:
-                    continue
-                loc = auth.location
-                title = auth.authority_title or ""
-                code = loc.code if loc else ""
-                if code:
-                    out.append(f"{title} @ {code}")
-                else:
-                    out.append(title)
-            return ", ".join(out) if out else "-"
-
-        def fmt_long(ba_list):
-            out = []
-            for ba in ba_list:
-                auth = ba.authority
-                if not auth:
-                    continue
-                loc = auth.location
-                title = auth.authority_title or ""
-                if loc:
-                    out.append(f"{title} @ {loc.name} [{loc.code}]")
-                else:
-                    out.append(title)
-            return ", ".join(out) if out else "-"
-
         booking_rows.append(
             {
                 "booking": b,
                 "trip_serial": booking_serials.get(b.id, 0),
-                "from_display_short": fmt_short(loading_auths),
-                "dest_display_short": fmt_short(unloading_auths),
-                "from_display_long": fmt_long(loading_auths),
-                "dest_display_long": fmt_long(unloading_auths),
+                "from_display_short": _fmt_auths_short(loading_auths),
+                "dest_display_short": _fmt_auths_short(unloading_auths),
+                "from_display_long": _fmt_auths_long(loading_auths),
+                "dest_display_long": _fmt_auths_long(unloading_auths),
                 "direction": direction,
             }
         )
@@ -1,5 +1,6 @@
 from flask import request, redirect, url_for
 from transport.models import db, Location
+from transport.cache_utils import location_options_cache
 from . import admin_bp
 
 
@@ -30,6 +31,7 @@ def add_location():
 
     db.session.add(loc)
     db.session.commit()
+    location_options_cache.clear()
 
     return _redirect_location_tab()
 
@@ -56,4 +58,5 @@ def edit_location():
         loc.address = address or None
 
     db.session.commit()
+    location_options_cache.clear()
     return _redirect_location_tab()
@@ -1,5 +1,6 @@
 from flask import request, redirect, url_for, flash
 from transport.models import db, LorryDetails
+from transport.cache_utils import lorry_options_cache
 from . import admin_bp
 
 
@@ -65,6 +66,7 @@ def add_lorry():
     )
     db.session.add(l)
     db.session.commit()
+    lorry_options_cache.clear()
 
     flash("Lorry type added successfully.", "success")
     return _redirect_lorry_tab()
@@ -131,6 +133,7 @@ def edit_lorry(lorry_id: int):
     l.remarks = remarks or None
 
     db.session.commit()
+    lorry_options_cache.clear()
     flash("Lorry type updated successfully.", "success")
     return _redirect_lorry_tab()
 
@@ -147,6 +150,7 @@ def delete_lorry(lorry_id: int):
 
     db.session.delete(l)
     db.session.commit()
+    lorry_options_cache.clear()
 
     flash("Lorry type deleted.", "success")
     return _redirect_lorry_tab()
@@ -1,6 +1,11 @@
+from collections import Counter
+
 from flask import request, redirect, url_for, flash
+from sqlalchemy import insert
+
 from transport.models import db, Route, RouteStop, Location
-from transport.route_utils import build_route_code_and_name
+from transport.cache_utils import route_km_cache
+from transport.route_utils import build_route_code_and_name, normalize_location_codes
 from . import admin_bp
 
 
@@ -20,12 +25,9 @@ def add_route():
     total_km = request.form.get("total_km", type=int)
     remarks = (request.form.get("remarks") or "").strip()
 
-    def normalize(codes):
-        return [c.strip().upper() for c in codes if c and c.strip()]
-
-    from_codes = normalize(from_codes_raw)
-    mid_codes = normalize(mid_codes_raw)
-    to_codes = normalize(to_codes_raw)
+    from_codes = normalize_location_codes(from_codes_raw)
+    mid_codes = normalize_location_codes(mid_codes_raw)
+    to_codes = normalize_location_codes(to_codes_raw)
 
     errors = []
 
@@ -45,12 +47,7 @@ def add_route():
     all_codes = from_codes + mid_codes + to_codes
 
     # Enforce that each location appears only once in the route
-    seen = set()
-    duplicates = []
-    for c in all_codes:
-        if c in seen and c not in duplicates:
-            duplicates.append(c)
-        seen.add(c)
+    duplicates = [c for c, n in Counter(all_codes).items() if n > 1]
 
     if duplicates:
         dup_str = ", ".join(duplicates)
@@ -60,21 +57,16 @@ def add_route():
         )
         return _redirect_route_tab()
 
-    # Validate all locations exist before creating anything
-    missing_codes = []
-    code_to_location = {}
-
-    for c in all_codes:
-        if c in code_to_location:
-            continue
-        loc = Location.query.filter_by(code=c).first()
-        if not loc:
-            missing_codes.append(c)
-        else:
-            code_to_location[c] = loc
+    # Validate all locations exist before creating anything (one query).
+    # Duplicates were rejected above, so all_codes is already unique.
+    code_to_location = {
+        loc.code: loc
+        for loc in Location.query.filter(Location.code.in_(all_codes)).all()
+    }
 
+    missing_codes = [c for c in all_codes if c not in code_to_location]
     if missing_codes:
-        human = ", ".join(sorted(set(missing_codes)))
+        human = ", ".join(sorted(missing_codes))
         flash(f"Unknown location code(s): {human}.", "error")
         return _redirect_route_tab()
 
@@ -87,31 +79,34 @@ def add_route():
         flash(f"Route already exists with code {existing.code}.", "info")
         return _redirect_route_tab()
 
-    # Create the Route
-    route = Route(
-        code=code,
-        name=name,
-        total_km=total_km,
-        remarks=remarks or None,
-    )
-    db.session.add(route)
-    db.session.flush()  # get route.id
-
-    # Create RouteStops in order
-    sequence_index = 1
-    for c in all_codes:
-        loc = code_to_location[c]
-
-        stop = RouteStop(
-            route_id=route.id,
-            location_id=loc.id,
-            sequence_index=sequence_index,
-            is_start_cluster=(c in from_codes),
-            is_end_cluster=(c in to_codes),
+    # Create the Route; RETURNING hands back the id without an ORM flush
+    route_id = db.session.execute(
+        insert(Route)
+        .values(
+            code=code,
+            name=name,
+            total_km=total_km,
+            remarks=remarks or None,
         )
-        db.session.add(stop)
-        sequence_index += 1
+        .returning(Route.id)
+    ).scalar_one()
+
+    # Create RouteStops in order (one multi-row INSERT)
+    from_set = set(from_codes)
+    to_set = set(to_codes)
+    stop_dicts = [
+        {
+            "route_id": route_id,
+            "location_id": code_to_location[c].id,
+            "sequence_index": idx,
+            "is_start_cluster": c in from_set,
+            "is_end_cluster": c in to_set,
+        }
+        for idx, c in enumerate(all_codes, start=1)
+    ]
+    db.session.execute(RouteStop.__table__.insert(), stop_dicts)
 
     db.session.commit()
+    route_km_cache.clear()
     flash("Route saved successfully.", "success")
     return _redirect_route_tab()